@@ -11,10 +11,13 @@ NOTE: Using "VERSION=edge docker-compose" for the `docker_compose_command` param
 You need to set parameters like VERSION with the python command running this script
     ex: VERSION=edge python source/deephaven_io_code.py ...
 """
-from run_code import run_code_main
+from run_code import run_code_main, find_files, print_run_results
 
+import sys
 import os
 import re
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 
 DOCKER_DEFAULT_PYTHON = "https://raw.githubusercontent.com/deephaven/deephaven-core/main/containers/python-examples/base/docker-compose.yml"
 DOCKER_DEFAULT_GROOVY = "https://raw.githubusercontent.com/deephaven/deephaven-core/main/containers/groovy-examples/docker-compose.yml"
@@ -24,6 +27,8 @@ DOCKER_SCIKIT_LEARN = "https://raw.githubusercontent.com/deephaven/deephaven-cor
 DOCKER_TENSORFLOW = "https://raw.githubusercontent.com/deephaven/deephaven-core/main/containers/python-examples/TensorFlow/docker-compose.yml"
 DOCKER_KAFKA = "https://raw.githubusercontent.com/deephaven/deephaven-core/main/containers/python-examples-redpanda/docker-compose.yml"
 
+DOCKER_CONFIG_REGEX = re.compile(rb'docker-config=(\S+)')
+
 DOCKER_CONFIG_TAG_TO_IMAGE = {
     "kafka": DOCKER_KAFKA,
     "pytorch": DOCKER_PYTORCH,
@@ -33,6 +38,48 @@ DOCKER_CONFIG_TAG_TO_IMAGE = {
     "default_groovy": DOCKER_DEFAULT_GROOVY
 }
 
+def read_docker_config(file_path: str):
+    """
+    Reads the markdown file at the given path and its first `docker-config` tag
+
+    Parameters:
+        file_path (str): The path to the markdown file
+    Returns:
+        tuple(str,bytes): The `docker-config` tag, or None if the file doesn't have one, and the raw file contents
+    """
+    with open(file_path, "rb") as f:
+        file_contents = f.read()
+    docker_config_match = DOCKER_CONFIG_REGEX.search(file_contents)
+    if docker_config_match is None:
+        return (None, file_contents)
+    return (docker_config_match.group(1).decode("utf-8"), file_contents)
+
+def download_file(url: str):
+    """
+    Downloads the file at the given URL
+
+    Parameters:
+        url (str): The URL of the file
+    Returns:
+        bytes: The contents of the file
+    """
+    with urllib.request.urlopen(url) as response:
+        return response.read()
+
+def download_docker_compose_files(docker_configs):
+    """
+    Downloads the docker-compose.yml files for the given `docker-config` tags in parallel. Each
+    distinct file is only downloaded once
+
+    Parameters:
+        docker_configs (iterable<str>): The `docker-config` tags
+    Returns:
+        dict: A dictionary of docker-compose.yml URLs to their contents
+    """
+    urls = list({DOCKER_CONFIG_TAG_TO_IMAGE[docker_config] for docker_config in docker_configs})
+    with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+        return dict(zip(urls, pool.map(download_file, urls)))
+
 def deephaven_io_code_main(deephaven_io_path: str, docker_compose_command: str, reset_between_files: int):
     """
     Main method for the deephaven_io_code.py file. Reads all the markdown files in the directory, organizes them
@@ -48,41 +95,51 @@ def deephaven_io_code_main(deephaven_io_path: str, docker_compose_command: str,
             after that number of code snippet runs
     """
     docker_configs_to_run = {
-        "default_python": set(),
-        "default_groovy": set()
+        "default_python": [],
+        "default_groovy": []
     }
 
-    for file_path in os.popen(f"find {deephaven_io_path} -type f -name \"*.md\" | sort").read().split("\n"):
-        if len(file_path) > 0 and file_path.endswith(".md"):
-            with open(file_path) as f:
-                file_contents = f.read()
-                if "docker-config" in file_contents:
-                    docker_config = re.findall(r'docker-config=(\S+)', file_contents)[0]
-                    if not docker_config in docker_configs_to_run.keys():
-                        docker_configs_to_run[docker_config] = set()
-                    docker_configs_to_run[docker_config].add(file_path)
-                else:
-                    docker_configs_to_run["default_python"].add(file_path)
-                    docker_configs_to_run["default_groovy"].add(file_path)
-
-    failed = False
+    file_paths = [file_path for file_path in sorted(find_files(deephaven_io_path)) if file_path and file_path.endswith(".md")]
+    #Threads share the read contents with this process, so they don't have to be pickled back from workers
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        file_docker_configs = list(pool.map(read_docker_config, file_paths))
+
+    #Files are visited in sorted order, so each list stays sorted and can't hold duplicates.
+    #Keep the contents so run_code_main doesn't read every file a second time
+    file_contents = {}
+    for (file_path, (docker_config, contents)) in zip(file_paths, file_docker_configs):
+        file_contents[file_path] = contents
+        if docker_config is not None:
+            if not docker_config in docker_configs_to_run.keys():
+                docker_configs_to_run[docker_config] = []
+            docker_configs_to_run[docker_config].append(file_path)
+        else:
+            docker_configs_to_run["default_python"].append(file_path)
+            docker_configs_to_run["default_groovy"].append(file_path)
+
+    docker_compose_files = download_docker_compose_files(docker_configs_to_run.keys())
+
+    #Group the configs that use the same docker-compose file so each server is only launched once
+    docker_compose_groups = {}
     for docker_config in docker_configs_to_run.keys():
-        os.system(f"curl -O {DOCKER_CONFIG_TAG_TO_IMAGE[docker_config]}")
         console_type = "groovy" if "groovy" in docker_config else "python"
-        (success_files, skipped_files, error_files) = run_code_main("localhost", "10000", console_type, docker_configs_to_run[docker_config], max_retries=20,
-                docker_compose="docker-compose", reset_between_files=reset_between_files)
-
-        if len(skipped_files) > 0:
-            print(f"Skipped {len(skipped_files)} files")
-        if len(success_files) > 0:
-            success_files_print = "\n".join(success_files)
-            print(f"The following files ran without error:\n{success_files_print}")
-        if len(error_files) > 0:
-            error_files_print = "\n".join(error_files)
-            print(f"Errors were found in the following files:\n{error_files_print}")
+        docker_compose_group = (DOCKER_CONFIG_TAG_TO_IMAGE[docker_config], console_type)
+        if not docker_compose_group in docker_compose_groups.keys():
+            docker_compose_groups[docker_compose_group] = []
+        docker_compose_groups[docker_compose_group].extend(docker_configs_to_run[docker_config])
+
+    failed = False
+    for ((docker_compose_url, console_type), file_paths) in docker_compose_groups.items():
+        with open("docker-compose.yml", "wb") as f:
+            f.write(docker_compose_files[docker_compose_url])
+        (success_files, skipped_files, error_files) = run_code_main("localhost", "10000", console_type, file_paths, max_retries=20,
+                docker_compose="docker-compose", reset_between_files=reset_between_files, file_contents=file_contents,
+                hard_reset=reset_between_files is not None)
+
+        if print_run_results(success_files, skipped_files, error_files):
             failed = True
 
-    os.system("rm docker-compose.yml")
+    os.remove("docker-compose.yml")
     if failed:
         sys.exit("At least 1 file failed to run. Check the logs for information on what failed")
 
@@ -91,8 +148,6 @@ usage: python deephaven_io_code.py <deephaven_io_path> <docker_compose_command>
 """
 
 if __name__ == '__main__':
-    import sys
-
     if len(sys.argv) > 4:
         sys.exit(usage)
 
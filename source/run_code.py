@@ -6,12 +6,18 @@ Python script to run the code in the given directory in Deephaven.
 This script looks for either .py files or .md files. If a .py file is found, then its contents are run in Deephaven.
 If a .md file is found, the code within the ```python ``` tags is extracted and run in Deephaven.
 """
-from pydeephaven import Session, DHError
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from itertools import islice
+from functools import lru_cache
 
 import sys
 import time
+import random
 import os
 import re
+import mmap
+import subprocess
 
 PYTHON_START_TAG = "```python"
 PYTHON_END_TAG = "```"
@@ -21,6 +27,22 @@ GROOVY_START_TAG = "```groovy"
 GROOVY_END_TAG = "```"
 GROOVY_EXTENSION = ".groovy"
 
+#Scripts that clear the variables a session has defined, keeping the __ prefixed variables the server sets
+PYTHON_RESET_SCRIPT = "[globals().pop(name) for name in [name for name in globals() if not name.startswith('__')]]"
+GROOVY_RESET_SCRIPT = "binding.variables.keySet().removeIf { !it.startsWith('__') }"
+SESSION_TYPE_TO_RESET_SCRIPT = {
+    "python": PYTHON_RESET_SCRIPT,
+    "groovy": GROOVY_RESET_SCRIPT
+}
+
+#Matches the flags on a code block's start tag line, capturing the flag name and the test-set number
+TAG_FLAG_REGEX = re.compile(rb'(should-fail|test-set)(?:=(\d+))?')
+
+PREFETCH_COUNT = 8
+
+CONNECT_RETRY_INITIAL_DELAY = 0.1
+CONNECT_RETRY_MAX_DELAY = 5.0
+
 def session_type_to_tags_and_extension(session_type):
     """
     Converts the session type to the markdown start and end tags, and
@@ -50,8 +72,8 @@ def read_code_file(file_path):
             Distinguished by the "should_run" and "should_fail" keys
     """
     script_string = None
-    with open(file_path) as f:
-        script_string = f.read()
+    with open(file_path, "rb") as f:
+        script_string = f.read().decode("utf-8")
 
     return {
         "should_run": [script_string],
@@ -69,6 +91,43 @@ def read_markdown_file(file_path, start_tag, end_tag):
         start_tag (str): The tag to represent the start of a code block
         end_tag (str): The tag to represent the end of a code block
 
+    Returns:
+        dict: A dictionary of code snippets to run, and code snippets that should fail.
+            Distinguished by the "should_run" and "should_fail" keys
+    """
+    #Files too small to hold a start tag line and an end tag can't have a code block
+    if os.path.getsize(file_path) < len(start_tag) + len(end_tag) + 1:
+        return read_markdown_contents(b"", start_tag, end_tag)
+
+    with open(file_path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as contents:
+            return read_markdown_contents(contents, start_tag, end_tag)
+
+@lru_cache(maxsize=None)
+def code_block_regex(start_tag, end_tag):
+    """
+    Compiles the regex that matches a markdown code block between the given tags. Code blocks whose start
+    tag line contains `skip-test` or `syntax` aren't matched.
+
+    Parameters:
+        start_tag (str): The tag to represent the start of a code block
+        end_tag (str): The tag to represent the end of a code block
+    Returns:
+        re.Pattern: The bytes regex, capturing the rest of the start tag line and the code in the block
+    """
+    return re.compile(b"^" + re.escape(start_tag.encode()) + rb"(?![^\n]*(?:skip-test|syntax))([^\n]*)\n(.*?)^" + re.escape(end_tag.encode()),
+            re.DOTALL | re.MULTILINE)
+
+def read_markdown_contents(contents, start_tag, end_tag):
+    """
+    Extracts the code scripts between the given tags in already read markdown contents. Works
+    the same as read_markdown_file for callers that have the file contents in memory.
+
+    Parameters:
+        contents (bytes): The raw contents of the markdown file. Any bytes-like object such as an mmap works
+        start_tag (str): The tag to represent the start of a code block
+        end_tag (str): The tag to represent the end of a code block
+
     Returns:
         dict: A dictionary of code snippets to run, and code snippets that should fail.
             Distinguished by the "should_run" and "should_fail" keys
@@ -77,45 +136,140 @@ def read_markdown_file(file_path, start_tag, end_tag):
     test_set_should_run = {}
     no_test_set_should_fail = []
     test_set_should_fail = {}
-    test_set = None
-    should_fail = None
-
-    with open(file_path) as f:
-        in_script = False
-        current_script = None
-        for line in f.readlines():
-            skip_line = ("skip-test" in line) or ("syntax" in line)
-            if (line.startswith(start_tag)) and (not in_script) and (not skip_line):
-                in_script = True
-                should_fail = "should-fail" in line
-                current_script = ""
-                if "test-set" in line:
-                    #Grab just the first test-set
-                    test_set = int(re.findall(r'test-set=(\d+)', line)[0])
-            elif (line.startswith(end_tag)) and in_script:
-                in_script = False
-
-                if test_set is None:
-                    current_list = no_test_set_should_fail if should_fail else no_test_set_should_run
-                    current_list.append(current_script)
-                else:
-                    current_dictionary = test_set_should_fail if should_fail else test_set_should_run
-                    if not (test_set in current_dictionary.keys()):
-                        current_dictionary[test_set] = ""
-                    current_dictionary[test_set] += current_script
-
-                test_set = None
-            elif in_script:
-                current_script += line
+
+    #Find the code blocks in the raw bytes with one regex scan and only decode the extracted code
+    for code_block_match in code_block_regex(start_tag, end_tag).finditer(contents):
+        (tag_line, current_script) = code_block_match.groups()
+        tag_flags = {}
+        for flag_match in TAG_FLAG_REGEX.finditer(tag_line):
+            #Grab just the first value of each flag
+            (flag, value) = flag_match.groups()
+            if tag_flags.get(flag) is None:
+                tag_flags[flag] = value
+
+        should_fail = b"should-fail" in tag_flags
+        test_set = tag_flags.get(b"test-set")
+        if test_set is not None:
+            test_set = int(test_set)
+
+        if test_set is None:
+            current_list = no_test_set_should_fail if should_fail else no_test_set_should_run
+            current_list.append(current_script.decode("utf-8"))
+        else:
+            current_dictionary = test_set_should_fail if should_fail else test_set_should_run
+            if not (test_set in current_dictionary.keys()):
+                current_dictionary[test_set] = []
+            current_dictionary[test_set].append(current_script)
 
     #TODO: track the test-sets? track the lines of code in the markdown files?
-    should_run_list = no_test_set_should_run + [test_set_should_run[key] for key in test_set_should_run.keys()]
-    should_fail_list = no_test_set_should_fail + [test_set_should_fail[key] for key in test_set_should_fail.keys()]
+    should_run_list = no_test_set_should_run + [b"".join(test_set_should_run[key]).decode("utf-8") for key in test_set_should_run.keys()]
+    should_fail_list = no_test_set_should_fail + [b"".join(test_set_should_fail[key]).decode("utf-8") for key in test_set_should_fail.keys()]
     return {
         "should_run": should_run_list,
         "should_fail": should_fail_list
     }
 
+@lru_cache(maxsize=None)
+def normalize_path(path: str):
+    """
+    Converts the given path to its canonical absolute form so that the same file matches
+    regardless of relative prefixes, trailing slashes, or symlinks. The result is interned so
+    repeated membership checks against the ignore paths compare by identity
+
+    Parameters:
+        path (str): The path to normalize
+    Returns:
+        str: The normalized path
+    """
+    return sys.intern(os.path.normpath(os.path.realpath(path)))
+
+def find_files(*paths: str):
+    """
+    Recursively walks the directories at the given paths in a single pass and returns every file in them and
+    their sub directories. Files are returned in the order they're found, so callers that need an order must sort them.
+
+    Parameters:
+        paths (str): The paths to the directories to walk
+    Returns:
+        list: The list of file paths in the directories
+    """
+    files = []
+    directories = []
+    for path in paths:
+        if os.path.isdir(path):
+            directories.append(path)
+        else:
+            print(f"Directory {path} not found")
+
+    while directories:
+        with os.scandir(directories.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    files.append(entry.path)
+
+    return files
+
+def script_readers(start_tag, end_tag, code_file_extension, file_contents=None):
+    """
+    Builds the table of file extensions to the functions that read code snippets from those files
+
+    Parameters:
+        start_tag (str): The tag to represent the start of a code block in markdown files
+        end_tag (str): The tag to represent the end of a code block in markdown files
+        code_file_extension (str): The extension of code files to read
+        file_contents (dict<str,bytes>): Already read markdown file contents keyed by file path. Files
+            found here aren't read again. Defaults to None
+    Returns:
+        dict: A dictionary of file extensions to functions that take a file path and return its code snippets
+    """
+    def read_markdown(file_path):
+        if (file_contents is not None) and (file_path in file_contents):
+            return read_markdown_contents(file_contents[file_path], start_tag, end_tag)
+        return read_markdown_file(file_path, start_tag, end_tag)
+
+    return {
+        ".md": read_markdown,
+        code_file_extension: read_code_file
+    }
+
+def read_script_strings(file_path, readers):
+    """
+    Reads the code snippets from the file at the given path based on its extension
+
+    Parameters:
+        file_path (str): The path to the file to read
+        readers (dict): The table of file extensions to reader functions from script_readers
+    Returns:
+        dict: A dictionary of code snippets to run, and code snippets that should fail.
+            Distinguished by the "should_run" and "should_fail" keys
+    """
+    return readers[os.path.splitext(file_path)[1]](file_path)
+
+def prefetch_script_strings(file_paths, readers):
+    """
+    Reads the code snippets from the given files on background threads, keeping up to PREFETCH_COUNT
+    files read ahead of the caller so file reads overlap with running the code in Deephaven
+
+    Parameters:
+        file_paths (list<str>): The paths to the files to read
+        readers (dict): The table of file extensions to reader functions from script_readers
+    Yields:
+        tuple(str,dict): The file path and the result of read_script_strings for that file, in the given order
+    """
+    file_paths = iter(file_paths)
+    with ThreadPoolExecutor(max_workers=PREFETCH_COUNT) as pool:
+        def submit(file_path):
+            return (file_path, pool.submit(read_script_strings, file_path, readers))
+
+        pending = deque(submit(file_path) for file_path in islice(file_paths, PREFETCH_COUNT))
+        while pending:
+            (file_path, future) = pending.popleft()
+            for next_file_path in islice(file_paths, 1):
+                pending.append(submit(next_file_path))
+            yield (file_path, future.result())
+
 def path_to_files(path: str):
     """
     Converts the directory/file at the given path to a set of files.
@@ -130,20 +284,42 @@ def path_to_files(path: str):
         return files
 
     if os.path.isfile(path):
+        #Collect the directories so they're all walked together
+        directories = []
         with open(path) as f:
-            for line in f.read().split("\n"):
-                if len(line) > 0:
+            for line in f:
+                line = line.rstrip("\n")
+                if line:
                     if os.path.isfile(line):
                         files.add(line)
                     else:
-                        files = files.union(path_to_files(line))
+                        directories.append(line)
+        files.update(find_files(*directories))
     else:
-        for line in os.popen(f"find {path} -type f | sort").read().split("\n"):
-            files.add(line)
-    
+        files.update(find_files(path))
+
     return files
 
-def connect_to_deephaven(host: str, port: int, max_retries: int, session_type: str):
+def path_to_ignore_paths(path: str):
+    """
+    Converts the directory/file at the given path to a set of paths to ignore. Unlike path_to_files,
+    directories aren't walked since run_code_main skips everything under an ignored directory.
+
+    Parameters:
+        path (str): The path to the directory/file to read
+    Returns:
+        frozenset: The set of files and directories to ignore
+    """
+    if path is None:
+        return frozenset()
+
+    if os.path.isfile(path):
+        with open(path) as f:
+            lines = (line.rstrip("\n") for line in f)
+            return frozenset(line for line in lines if line)
+    return frozenset([path])
+
+def connect_to_deephaven(host: str, port: int, max_retries: int, session_type: str, docker_compose_up=None):
     """
     Connects to Deephaven with retry logic
 
@@ -152,32 +328,242 @@ def connect_to_deephaven(host: str, port: int, max_retries: int, session_type: s
         port (int): The port on the host to access
         max_retries (int): The maximum attempts to retry connecting to Deephaven
         session_type (str): The Deephaven session type
+        docker_compose_up (subprocess.Popen): The running `up -d` command launching the server. Attempts made
+            before it finishes, such as while images are pulled, don't count towards max_retries. Defaults to None
     Returns:
         Session: The Deephaven session
     """
+    #pydeephaven pulls in gRPC and protobuf, so it's only imported once Deephaven is needed
+    from pydeephaven import Session, DHError
+
     print(f"Attempting to connect to host at {host} on port {port}")
 
-    #Simple retry loop in case the server tries to launch before Deephaven is ready
+    #Retry loop with jittered exponential backoff in case the server tries to launch before Deephaven is ready
     count = 0
-    session = None
-    while (count < max_retries):
+    attempt = 0
+    while count < max_retries:
         try:
             session = Session(host=host, port=port, session_type=session_type)
             print("Connected to Deephaven")
-            break
-        except DHError as e:
-            time.sleep(1)
-            count += 1
-        except Exception as e:
-            time.sleep(1)
-            count += 1
-    if session is None:
-        sys.exit(f"Failed to connect to Deephaven after {max_retries} attempts")
-
-    return session
+            return session
+        except (DHError, OSError) as e:
+            if (docker_compose_up is None) or (docker_compose_up.poll() is not None):
+                count += 1
+            delay = min(CONNECT_RETRY_INITIAL_DELAY * 2 ** attempt, CONNECT_RETRY_MAX_DELAY)
+            attempt += 1
+            time.sleep(delay * random.uniform(0.8, 1.2))
+
+    sys.exit(f"Failed to connect to Deephaven after {max_retries} attempts")
+
+def start_docker_compose(docker_compose: str):
+    """
+    Starts launching the docker-compose instance without waiting for it, so connecting to
+    Deephaven can be retried while the containers start. Uses the shell so commands can set
+    environment variables, like "VERSION=edge docker-compose -f <path>"
+
+    Parameters:
+        docker_compose (str): The docker-compose command to launch the server with
+    Returns:
+        subprocess.Popen: The running `up -d` command
+    """
+    return subprocess.Popen(f"{docker_compose} up -d", shell=True)
+
+class DeephavenConnection:
+    """
+    Holds a Deephaven session and reconnects it when running a script fails for a reason other
+    than a Deephaven error, such as the connection dropping, so later scripts don't run on a broken session
+    """
+    def __init__(self, host: str, port: int, max_retries: int, session_type: str, docker_compose_up=None):
+        """
+        Parameters:
+            host (str): The host name of the Deephaven instance
+            port (int): The port on the host to access
+            max_retries (int): The maximum attempts to retry connecting to Deephaven
+            session_type (str): The Deephaven session type
+            docker_compose_up (subprocess.Popen): The running `up -d` command launching the server. Defaults to None
+        """
+        self.host = host
+        self.port = port
+        self.max_retries = max_retries
+        self.session_type = session_type
+        self.session = connect_to_deephaven(host, port, max_retries, session_type, docker_compose_up)
+
+    def reconnect(self, docker_compose_up=None):
+        """
+        Replaces the session with a new connection to Deephaven
+
+        Parameters:
+            docker_compose_up (subprocess.Popen): The running `up -d` command relaunching the server. Defaults to None
+        """
+        self.session = connect_to_deephaven(self.host, self.port, self.max_retries, self.session_type, docker_compose_up)
+
+    def run_script(self, script_string: str):
+        """
+        Runs the script in Deephaven, reconnecting before raising any error that isn't a DHError
+
+        Parameters:
+            script_string (str): The script to run
+        """
+        from pydeephaven import DHError
+
+        try:
+            self.session.run_script(script_string)
+        except DHError:
+            raise
+        except Exception:
+            self.reconnect()
+            raise
+
+    def reset(self, docker_compose: str, hard_reset: bool):
+        """
+        Resets the Deephaven state between files. By default this clears the variables defined in the session,
+        which is much faster than restarting the server
+
+        Parameters:
+            docker_compose (str): The docker-compose command to restart the server with
+            hard_reset (bool): If True, restarts the server via the docker-compose command instead of clearing the session
+        """
+        if not hard_reset:
+            #Any failure, including a dropped connection, leaves the session in an unknown state, so reconnect and continue
+            try:
+                self.session.run_script(SESSION_TYPE_TO_RESET_SCRIPT[self.session_type])
+            except Exception as e:
+                print(e)
+                print("Error when trying to clear the session, reconnecting")
+                self.reconnect()
+            return
+
+        subprocess.run(f"{docker_compose} stop", shell=True)
+        docker_compose_up = start_docker_compose(docker_compose)
+        self.reconnect(docker_compose_up)
+        docker_compose_up.wait()
+
+def iterate_script_strings(script_strings):
+    """
+    Iterates over the non empty code snippets read from a file, code snippets to run first
+
+    Parameters:
+        script_strings (dict): A dictionary of code snippets to run, and code snippets that should fail.
+            Distinguished by the "should_run" and "should_fail" keys
+    Yields:
+        tuple(str,bool): The code snippet, and if it's expected to fail
+    """
+    for should_fail in (False, True):
+        for script_string in script_strings["should_fail" if should_fail else "should_run"]:
+            if script_string:
+                yield (script_string, should_fail)
+
+def run_script_string(session, file_path, script_string, should_fail):
+    """
+    Runs a code snippet in Deephaven
+
+    Parameters:
+        session (DeephavenConnection): The Deephaven session to run the code in
+        file_path (str): The path to the file the code snippet was read from
+        script_string (str): The code snippet
+        should_fail (bool): If the code snippet is expected to raise an error in Deephaven
+    Returns:
+        bool: True if the code snippet didn't behave as expected
+    """
+    from pydeephaven import DHError
+
+    try:
+        session.run_script(script_string)
+    except DHError as e:
+        if should_fail:
+            return False #Failed as expected
+        print(e)
+        print(f"Deephaven error when trying to run code in {file_path}")
+        return True
+    except Exception as e:
+        print(e)
+        print(f"Unexpected error when trying to run code in {file_path}")
+        return True
+
+    return should_fail
+
+def run_script_strings(session, file_path, script_strings):
+    """
+    Runs all the code snippets read from a file in Deephaven
+
+    Parameters:
+        session (DeephavenConnection): The Deephaven session to run the code in
+        file_path (str): The path to the file the code snippets were read from
+        script_strings (dict): A dictionary of code snippets to run, and code snippets that should fail.
+            Distinguished by the "should_run" and "should_fail" keys
+    Returns:
+        tuple(int,bool): The number of code snippets ran, and if any of them didn't behave as expected
+    """
+    run_count = 0
+    failed = False
+    for (script_string, should_fail) in iterate_script_strings(script_strings):
+        run_count += 1
+        if run_script_string(session, file_path, script_string, should_fail):
+            failed = True
+
+    return (run_count, failed)
+
+def run_files_in_batches(session, file_script_strings, batch_size: int):
+    """
+    Runs the code snippets that should run from several files as one script, so many small files
+    take fewer requests to Deephaven. If a batch fails, its files are ran again one at a time to find
+    which ones have errors. Code snippets that should fail are always ran separately.
+
+    Parameters:
+        session (DeephavenConnection): The Deephaven session to run the code in
+        file_script_strings (iterable<tuple(str,dict)>): The file paths and the code snippets read from them
+        batch_size (int): The number of characters of code to collect before running a batch
+    Returns:
+        tuple(list,list,list): A list of success, skipped, and failed files ran.
+    """
+    success_files = []
+    skipped_files = []
+    error_files = []
+
+    def run_batch(batch):
+        batch_failed = False
+        #Markdown snippets already end in a newline, so only code files without one need it added
+        batch_script = "".join(script_string if script_string.endswith("\n") else script_string + "\n"
+                for (_, script_strings) in batch for script_string in script_strings["should_run"] if script_string)
+        if batch_script:
+            try:
+                session.run_script(batch_script)
+            except Exception as e:
+                print(e)
+                print("Error when trying to run a batch of files, running them one at a time")
+                batch_failed = True
+
+        for (file_path, script_strings) in batch:
+            if not batch_failed:
+                #The code snippets that should run already ran as part of the batch
+                ran_count = sum(1 for script_string in script_strings["should_run"] if script_string)
+                script_strings = {"should_run": [], "should_fail": script_strings["should_fail"]}
+            else:
+                ran_count = 0
+            (run_count, failed) = run_script_strings(session, file_path, script_strings)
+            if ran_count + run_count == 0:
+                skipped_files.append(file_path)
+            elif failed:
+                error_files.append(file_path)
+            else:
+                success_files.append(file_path)
+
+    batch = []
+    current_batch_size = 0
+    for (file_path, script_strings) in file_script_strings:
+        batch.append((file_path, script_strings))
+        current_batch_size += sum(len(script_string) for script_string in script_strings["should_run"])
+        if current_batch_size >= batch_size:
+            run_batch(batch)
+            batch = []
+            current_batch_size = 0
+    run_batch(batch)
+
+    return (success_files, skipped_files, error_files)
 
 def run_code_main(host: str, port: int, session_type: str, read_files: set, max_retries: int=25,
-            ignore_paths: set=None, docker_compose: str=None, reset_between_files: int=None):
+            ignore_paths: set=None, docker_compose: str=None, reset_between_files: int=None,
+            file_contents: dict=None, hard_reset: bool=False, batch_size: int=None):
     """
     Main method for the run_code.py script. Reads each file line by line and grabs lines
     between the ```python ``` tags to run in Deephaven.
@@ -186,140 +572,147 @@ def run_code_main(host: str, port: int, session_type: str, read_files: set, max_
         host (str): The host name of the Deephaven instance
         port (int): The port on the host to access
         session_type (str): The Deephaven session type
-        read_files (set<str>): A set of strings representing files to read
+        read_files (iterable<str>): The strings representing files to read. Duplicates are only ran once
         max_retries (int): The maximum attempts to retry connecting to Deephaven. Defaults to 25
-        ignore_paths (set<str>): A set of strings representing files to skip
+        ignore_paths (set<str>): A set of strings representing files and directories to skip. Everything under an ignored directory is skipped
         docker_compose (str): The docker-compose command to launch and reset the server if needed. Defaults to None
-        reset_between_files (int): Count to reset the server via the docker-compose command after the given number of files are ran. Defaults to None. Requires docker_compose to be defined
+        reset_between_files (int): Count to reset the Deephaven state after the given number of files are ran. Defaults to None
+        file_contents (dict<str,bytes>): Already read markdown file contents keyed by file path, so those files aren't read again. Defaults to None
+        hard_reset (bool): If True, resets restart the server via the docker-compose command instead of clearing the session. Defaults to False. Requires docker_compose and reset_between_files to be defined
+        batch_size (int): If set, code from several files is ran as one script once about this many characters are collected. Defaults to None. Can't be used with reset_between_files
     Returns:
         tuple(list,list,list): A list of success, skipped, and failed files ran.
     """
     start = time.time()
 
-    if (reset_between_files is not None) and (docker_compose is None):
-        raise ValueError("docker_compose must be defined if reset_between_files is defined")
+    if hard_reset and ((reset_between_files is None) or (docker_compose is None)):
+        raise ValueError("docker_compose and reset_between_files must be defined if hard_reset is set")
+    if (batch_size is not None) and (reset_between_files is not None):
+        raise ValueError("batch_size can't be defined with reset_between_files")
+    docker_compose_up = None
     if docker_compose is not None:
-        os.system(f"{docker_compose} up -d")
-    if ignore_paths is None:
-        ignore_paths = set()
+        docker_compose_up = start_docker_compose(docker_compose)
+    ignore_paths = frozenset() if ignore_paths is None else frozenset(normalize_path(path) for path in ignore_paths if path)
+    ignore_directories = tuple(path + os.sep for path in ignore_paths if os.path.isdir(path))
 
-    session = connect_to_deephaven(host, port, max_retries, session_type)
+    session = DeephavenConnection(host, port, max_retries, session_type, docker_compose_up)
+    if docker_compose_up is not None:
+        docker_compose_up.wait()
 
     #Grab the markdown tags and code files to look at based on the session type
     (start_tag, end_tag, code_file_extension) = session_type_to_tags_and_extension(session_type)
+    readers = script_readers(start_tag, end_tag, code_file_extension, file_contents)
 
     #Track file results
     error_files = []
     success_files = []
     skipped_files = []
 
-    #Reset counter
-    file_run_count = 0
+    #Drop duplicate and empty paths while keeping the given order, and skip ignored paths up front
+    read_files = [file_path for file_path in dict.fromkeys(read_files) if file_path]
+    def is_ignored(file_path):
+        #Normalizing hits the filesystem, so skip it when there's nothing to ignore
+        if not ignore_paths:
+            return False
+        file_path = normalize_path(file_path)
+        return (file_path in ignore_paths) or file_path.startswith(ignore_directories)
+
+    #Skip files that aren't code or markdown files before they're handed to the prefetch threads
+    files_to_read = []
     for file_path in read_files:
-        #Skip empty paths and ignore paths. Sometimes empty paths pop up with `find` commands
-        if len(file_path) > 0 and not (file_path in ignore_paths):
-            #If file should be read, read the code. Otherwise skip the file
-            script_strings = None
-            if file_path.endswith(".md"):
-                script_strings = read_markdown_file(file_path, start_tag, end_tag)
-            elif file_path.endswith(code_file_extension):
-                script_strings = read_code_file(file_path)
-            else:
-                skipped_files.append(file_path)
-                continue
+        if (os.path.splitext(file_path)[1] in readers) and not is_ignored(file_path):
+            files_to_read.append(file_path)
+        else:
+            skipped_files.append(file_path)
 
-#TODO: Bundle this duplicated code as a function
-            skipped = True
+    if batch_size is not None:
+        (batch_success_files, batch_skipped_files, batch_error_files) = run_files_in_batches(session,
+                prefetch_script_strings(files_to_read, readers), batch_size)
+        success_files.extend(batch_success_files)
+        skipped_files.extend(batch_skipped_files)
+        error_files.extend(batch_error_files)
+    else:
+        #Reset counter
+        do_reset = reset_between_files is not None
+        file_run_count = 0
+        for (file_path, script_strings) in prefetch_script_strings(files_to_read, readers):
+            run_count = 0
             failed = False
-            for script_string in script_strings["should_run"]:
-                if len(script_string) != 0:
-                    #Code found, run it in Deephaven
-                    try:
-                        skipped = False
-                        file_run_count += 1
-                        session.run_script(script_string)
-                    except DHError as e:
-                        print(e)
-                        print(f"Deephaven error when trying to run code in {file_path}")
-                        failed = True
-                    except Exception as e:
-                        print(e)
-                        print(f"Unexpected error when trying to run code in {file_path}")
-                        failed = True
-
-                    #If reset is enabled, shut down and restart
-                    if (reset_between_files is not None) and (file_run_count > reset_between_files):
-                        os.system(f"{docker_compose} stop")
-                        os.system(f"{docker_compose} up -d")
-                        session = connect_to_deephaven(host, port, max_retries, session_type)
-                        file_run_count = 0
-            for script_string in script_strings["should_fail"]:
-                if len(script_string) != 0:
-                    #Code found, run it in Deephaven
-                    try:
-                        skipped = False
-                        file_run_count += 1
-                        session.run_script(script_string)
-                        failed = True #This will be skipped if run_script raises an error
-                    except DHError as e:
-                        pass #Failed as expected
-                    except Exception as e:
-                        print(e)
-                        print(f"Unexpected error when trying to run code in {file_path}")
-                        failed = True
-
-                    #If reset is enabled, shut down and restart
-                    if (reset_between_files is not None) and (file_run_count > reset_between_files):
-                        os.system(f"{docker_compose} stop")
-                        os.system(f"{docker_compose} up -d")
-                        session = connect_to_deephaven(host, port, max_retries, session_type)
-                        file_run_count = 0
-
-            if skipped:
+            for (script_string, should_fail) in iterate_script_strings(script_strings):
+                run_count += 1
+                file_run_count += 1
+                if run_script_string(session, file_path, script_string, should_fail):
+                    failed = True
+
+                #If reset is enabled, clear the session or restart the server
+                if do_reset and (file_run_count > reset_between_files):
+                    session.reset(docker_compose, hard_reset)
+                    file_run_count = 0
+
+            if run_count == 0:
                 skipped_files.append(file_path)
+            elif failed:
+                error_files.append(file_path)
             else:
-                if failed:
-                    error_files.append(file_path)
-                else:
-                    success_files.append(file_path)
-
-
-        else:
-            skipped_files.append(file_path)
+                success_files.append(file_path)
 
     end = time.time()
     print(f"{end - start} seconds to run")
 
-    #If reset is enabled, shut down
-    if (reset_between_files is not None):
-        os.system(f"{docker_compose} stop")
+    #If hard reset is enabled, shut down
+    if hard_reset:
+        subprocess.run(f"{docker_compose} stop", shell=True)
 
     return (success_files, skipped_files, error_files)
 
-if __name__ == '__main__':
-    import argparse
-    parser = argparse.ArgumentParser()
-    parser.add_argument("host", help="The Deephaven host", type=str)
-    parser.add_argument("port", help="The port to access Deephaven on", type=int)
-    parser.add_argument("session_type", help="The Deephaven session type", choices=["python", "groovy"])
-    parser.add_argument("run_path", help="Path to the file containing a line separated list of files/paths to run, or directory to run", type=str)
-    parser.add_argument("-mr", "--max_retries", help="The maximum number of retries when trying to connect to Deephaven", type=int, default=25)
-    parser.add_argument("-rbf", "--reset_between_files", help="If set, resets the server after the given number of files are ran. Use 0 to reset after every file. Defaults to None. Requires -dc/--docker_compose to be set", type=int, default=None)
-    parser.add_argument("-dc", "--docker_compose", help="docker-compose command to run to launch the server in the form of \"docker-compose -f <path>\"", type=str)
-    parser.add_argument("-ip", "--ignore_path", help="Path to the file containing a line separated list of files/paths to ignore, or directory to ignore", type=str)
-
-
-    args = parser.parse_args()
-    (success_files, skipped_files, error_files) = run_code_main(args.host, args.port, args.session_type, path_to_files(args.run_path), max_retries=args.max_retries,
-            ignore_paths=path_to_files(args.ignore_path), docker_compose=args.docker_compose,
-            reset_between_files=args.reset_between_files)
-
-    if len(skipped_files) > 0:
+def print_run_results(success_files: list, skipped_files: list, error_files: list):
+    """
+    Prints the summary of the files returned by run_code_main
+
+    Parameters:
+        success_files (list<str>): The files that ran without error
+        skipped_files (list<str>): The files that were skipped
+        error_files (list<str>): The files that had errors
+    Returns:
+        bool: True if any files had errors
+    """
+    if skipped_files:
         print(f"Skipped {len(skipped_files)} files")
-    if len(success_files) > 0:
-        success_files_print = "\n".join(success_files)
-        print(f"The following files ran without error:\n{success_files_print}")
-    if len(error_files) > 0:
-        error_files_print = "\n".join(error_files)
-        print(f"Errors were found in the following files:\n{error_files_print}")
+    #Write the paths one at a time instead of joining them into one large string
+    if success_files:
+        sys.stdout.write("The following files ran without error:\n")
+        sys.stdout.writelines(file_path + "\n" for file_path in success_files)
+    if error_files:
+        sys.stdout.write("Errors were found in the following files:\n")
+        sys.stdout.writelines(file_path + "\n" for file_path in error_files)
+        return True
+    return False
+
+if __name__ == '__main__':
+    #Only pay for importing argparse when flags are given or the positional arguments need validating
+    if (len(sys.argv) == 5) and (not any(arg.startswith("-") for arg in sys.argv[1:])) and sys.argv[2].isdigit() \
+            and (sys.argv[3] in ("python", "groovy")):
+        (host, port, session_type, run_path) = sys.argv[1:]
+        (success_files, skipped_files, error_files) = run_code_main(host, int(port), session_type, path_to_files(run_path))
+    else:
+        import argparse
+        parser = argparse.ArgumentParser()
+        parser.add_argument("host", help="The Deephaven host", type=str)
+        parser.add_argument("port", help="The port to access Deephaven on", type=int)
+        parser.add_argument("session_type", help="The Deephaven session type", choices=["python", "groovy"])
+        parser.add_argument("run_path", help="Path to the file containing a line separated list of files/paths to run, or directory to run", type=str)
+        parser.add_argument("-mr", "--max_retries", help="The maximum number of retries when trying to connect to Deephaven", type=int, default=25)
+        parser.add_argument("-rbf", "--reset_between_files", help="If set, clears the Deephaven session after the given number of files are ran. Use 0 to reset after every file. Defaults to None", type=int, default=None)
+        parser.add_argument("-hr", "--hard_reset", help="If set, resets restart the server with the docker-compose command instead of clearing the session. Requires -rbf/--reset_between_files and -dc/--docker_compose to be set", action="store_true")
+        parser.add_argument("-dc", "--docker_compose", help="docker-compose command to run to launch the server in the form of \"docker-compose -f <path>\"", type=str)
+        parser.add_argument("-ip", "--ignore_path", help="Path to the file containing a line separated list of files/paths to ignore, or directory to ignore", type=str)
+        parser.add_argument("-bs", "--batch_size", help="If set, runs code from several files as one script once about this many characters are collected. Defaults to None. Can't be used with -rbf/--reset_between_files", type=int, default=None)
+
+        args = parser.parse_args()
+        (success_files, skipped_files, error_files) = run_code_main(args.host, args.port, args.session_type, path_to_files(args.run_path), max_retries=args.max_retries,
+                ignore_paths=path_to_ignore_paths(args.ignore_path), docker_compose=args.docker_compose,
+                reset_between_files=args.reset_between_files, hard_reset=args.hard_reset,
+                batch_size=args.batch_size)
+
+    if print_run_results(success_files, skipped_files, error_files):
         sys.exit("At least 1 file failed to run. Check the logs for information on what failed")
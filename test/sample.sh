@@ -7,8 +7,12 @@ docker-compose -f ./test/docker-compose.yml up -d
 #Run a directory
 python source/run_code.py localhost 10000 python ./test/code/
 #Reset between runs
-python source/run_code.py localhost 10000 python ./test/files/run.txt -rbf 0 -dc "docker-compose -f ./test/docker-compose.yml"
+python source/run_code.py localhost 10000 python ./test/files/run.txt -rbf 0
+#Restart the server between runs
+python source/run_code.py localhost 10000 python ./test/files/run.txt -rbf 0 -hr -dc "docker-compose -f ./test/docker-compose.yml"
 docker-compose -f ./test/docker-compose.yml up -d
+#Run files in batches of about 1000 characters of code
+python source/run_code.py localhost 10000 python ./test/files/run.txt -bs 1000
 #Should ignore the files in the sub_dir directory
 python source/run_code.py localhost 10000 python ./test/files/run.txt -ip ./test/files/ignore-files.txt
 #Should ignore the sub_dir directory